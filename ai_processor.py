@@ -1,9 +1,10 @@
 import os
 import requests
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 import logging
 from dotenv import load_dotenv
+import openrouter_client
 
 # Load environment variables
 load_dotenv()
@@ -19,13 +20,6 @@ class AIProcessor:
         """
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.model = model
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://echomind-ai.vercel.app",  # Optional, for tracking
-            "X-Title": "EchoMind AI Assistant"  # Optional, shown in rankings on openrouter.ai
-        }
         
         # Configure logging
         logging.basicConfig(level=logging.INFO)
@@ -48,8 +42,6 @@ class AIProcessor:
         """
         # Default parameters
         params = {
-            "model": self.model,
-            "messages": messages,
             "temperature": 0.7,
             "max_tokens": 1000,
             "top_p": 1.0,
@@ -63,22 +55,10 @@ class AIProcessor:
         
         try:
             self.logger.info(f"Sending request to {self.model}...")
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json=params,
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return None
-                
+            return openrouter_client.chat(messages, self.model, api_key=self.api_key, **params)
+        except ValueError as e:
+            self.logger.error(str(e))
+            return None
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error making API request: {str(e)}")
             if hasattr(e, 'response') and e.response is not None:
@@ -89,6 +69,28 @@ class AIProcessor:
                     self.logger.error(f"API Error Response: {e.response.text}")
             return None
     
+    def stream_response(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """
+        Stream a response from the OpenRouter API as it is generated.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content' keys.
+            **kwargs: Additional parameters to pass to the API (temperature, max_tokens, etc.)
+            
+        Yields:
+            str: Content deltas of the generated response, in order.
+        """
+        params = {
+            "temperature": 0.7,
+            "max_tokens": 1000
+        }
+        params.update(kwargs)
+        
+        self.logger.info(f"Streaming request to {self.model}...")
+        with openrouter_client.chat(messages, self.model, stream=True, api_key=self.api_key,
+                                    **params) as deltas:
+            yield from deltas
+    
     def process_conversation(self, user_input: str, conversation_history: List[Dict[str, str]] = None, 
                            system_prompt: str = None) -> str:
         """
@@ -102,6 +104,25 @@ class AIProcessor:
         Returns:
             str: The AI's response text.
         """
+        return self.generate_response(self._build_messages(user_input, conversation_history, system_prompt))
+    
+    def stream_conversation(self, user_input: str, conversation_history: List[Dict[str, str]] = None,
+                            system_prompt: str = None) -> Iterator[str]:
+        """
+        Process a conversation turn like process_conversation, streaming the reply.
+        
+        Args:
+            user_input: The user's input text.
+            conversation_history: List of previous messages in the conversation.
+            system_prompt: Optional system message to set the assistant's behavior.
+            
+        Yields:
+            str: Content deltas of the AI's response, in order.
+        """
+        return self.stream_response(self._build_messages(user_input, conversation_history, system_prompt))
+    
+    def _build_messages(self, user_input: str, conversation_history: Optional[List[Dict[str, str]]],
+                        system_prompt: Optional[str]) -> List[Dict[str, str]]:
         messages = []
         
         # Add system prompt if provided
@@ -114,9 +135,7 @@ class AIProcessor:
         
         # Add current user input
         messages.append({"role": "user", "content": user_input})
-        
-        # Generate response
-        return self.generate_response(messages)
+        return messages
 
 # Example usage
 if __name__ == "__main__":
@@ -1,22 +1,43 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 import os
-from gtts import gTTS
-import base64
-from io import BytesIO
-import requests
+import sys
+import atexit
+import logging
+import logging.handlers
+import re
+import uuid
+import queue
+import threading
+import functools
+import orjson
 from dotenv import load_dotenv
-from stt_engine import STTEngine
-import tempfile
-import speech_recognition as sr
+import openrouter_client
+import tts
+from response_cache import ResponseCache
+from history_store import create_history_store
 
 app = Flask(__name__)
 
+# Request handlers only enqueue log records; a background listener thread
+# does the actual (locking, blocking) writes to stderr
+log_queue = queue.SimpleQueue()
+log_handler = logging.StreamHandler(sys.stderr)
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+root_logger = logging.getLogger()
+root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+root_logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
 # Configure OpenRouter API
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-MODEL = "openai/gpt-3.5-turbo"  # Standard model on OpenRouter
+MODEL = os.getenv('OPENROUTER_MODEL', 'openai/gpt-3.5-turbo')
 
 if not OPENROUTER_API_KEY:
     raise ValueError("OPENROUTER_API_KEY not found in environment variables")
@@ -26,17 +47,67 @@ print("\n=== Environment Variables ===")
 print(f"OPENROUTER_API_KEY: {'*' * 8}{OPENROUTER_API_KEY[-4:] if OPENROUTER_API_KEY else 'None'}")
 print("===========================\n")
 
-chat_history = []
+# Conversation history per browser session, in Redis when REDIS_URL is set
+MAX_HISTORY = 50  # user/assistant messages kept before the oldest turns are dropped
+history_store = create_history_store(max_messages=MAX_HISTORY)
+SESSION_COOKIE = 'echomind_session'
+SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+def get_session_id():
+    """Return the caller's session id, issuing a new one if the cookie is missing."""
+    session_id = request.cookies.get(SESSION_COOKIE, '')
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        session_id = uuid.uuid4().hex
+        g.new_session_id = session_id
+    return session_id
+
+@app.after_request
+def set_session_cookie(response):
+    session_id = g.pop('new_session_id', None)
+    if session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+    return response
+
+# Semantic cache of replies for repeated/near-duplicate prompts
+response_cache = ResponseCache(cache_dir=os.getenv('RESPONSE_CACHE_DIR', 'cache/responses'))
+
+def sse_event(payload):
+    """Format a payload as a server-sent event."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
 
-# Initialize STT engine for backend voice recognition
-stt_engine = STTEngine(model_name="whisper")
+@functools.lru_cache(maxsize=1)
+def get_whisper():
+    """
+    Load the Whisper model for /transcribe_audio on first use.
+
+    faster-whisper and CTranslate2 are imported here too, so the process starts
+    at Flask baseline and only pays for the model once a transcription arrives.
+    On a CUDA GPU it runs in FP16 on the tensor cores; on CPU int8 weights run
+    ~2x faster than FP32.
+    """
+    import ctranslate2
+    from faster_whisper import WhisperModel
+
+    if ctranslate2.get_cuda_device_count() > 0:
+        return WhisperModel("base", device="cuda", compute_type="float16")
+    return WhisperModel("base", device="cpu", compute_type="int8")
+
+@functools.lru_cache(maxsize=1)
+def get_stt():
+    """Return the batcher that shares get_whisper()'s model between concurrent requests."""
+    from batched_stt import BatchedSTT
+    return BatchedSTT(get_whisper())
+
+# Serializes the first-use model load; transcriptions themselves are batched
+whisper_lock = threading.Lock()
 
 @app.route('/')
 def home():
+    get_session_id()
     return render_template('index.html')
 
-@app.route('/process_input', methods=['POST'])
-def process_input():
+@app.route('/chat', methods=['POST'])
+def chat():
     try:
         if not request.is_json:
             raise ValueError("Request must be JSON")
@@ -45,89 +116,104 @@ def process_input():
         if not user_input:
             raise ValueError("Input cannot be empty")
         
-        print(f"Received input: {user_input}")
+        logger.debug("Received input: %s", user_input)
+        
+        session_id = get_session_id()
+        history = history_store.get(session_id)
+        user_message = {"role": "user", "content": user_input}
         
-        # Add user message to chat history
-        chat_history.append({"role": "user", "content": user_input})
+        # Serve repeated prompts from the cache without calling the LLM
+        cached_response = response_cache.get(user_input, history)
+        if cached_response:
+            audio_token, speech_job = tts.create_speech_job()
+            for sentence in tts.split_sentences(cached_response):
+                speech_job.add(sentence)
+            speech_job.close()
+            history_store.append(session_id, user_message, {"role": "assistant", "content": cached_response})
+            return Response(sse_event({'audio_url': f'/audio/{audio_token}'}) +
+                            sse_event({'delta': cached_response}) +
+                            sse_event({'done': True, 'text': cached_response}),
+                            mimetype='text/event-stream')
         
         if not OPENROUTER_API_KEY:
             raise ValueError("OpenRouter API key is not configured")
             
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://echomind-ai-assistant.com",
-            "X-Title": "EchoMind Voice Assistant"
-        }
-        
-        payload = {
-            "model": MODEL,
-            "messages": chat_history
-        }
-        
-        # Make request to OpenRouter
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        # Stream the completion from OpenRouter and forward each token to the
+        # browser, handing complete sentences to TTS while generation continues
+        try:
+            deltas = openrouter_client.chat(history + [user_message], MODEL, stream=True,
+                                            api_key=OPENROUTER_API_KEY)
+        except openrouter_client.OpenRouterError as e:
+            logger.error(str(e))
+            return jsonify({'error': str(e)}), 500
         
-        print(f"OpenRouter response status: {response.status_code}")
-        print(f"Response content: {response.text[:500]}")  # Log first 500 chars of response
+        audio_token, speech_job = tts.create_speech_job()
         
-        if response.status_code == 200:
-            data = response.json()
-            print(f"Parsed response data: {data}")
-            
-            if not isinstance(data, dict):
-                raise ValueError(f"Unexpected response format: {type(data)}")
+        def generate():
+            parts = []
+            pending = ''
+            try:
+                # The browser can open the audio stream right away; it starts
+                # playing as soon as the first sentence is synthesized
+                yield sse_event({'audio_url': f'/audio/{audio_token}'})
                 
-            if 'choices' not in data or not data['choices']:
-                raise ValueError(f"No choices in response: {data}")
+                for delta in deltas:
+                    parts.append(delta)
+                    yield sse_event({'delta': delta})
+                    
+                    pending += delta
+                    *sentences, pending = tts.SENTENCE_BOUNDARY.split(pending)
+                    for sentence in sentences:
+                        if sentence.strip():
+                            speech_job.add(sentence.strip())
                 
-            if not isinstance(data['choices'], list) or len(data['choices']) == 0:
-                raise ValueError(f"Invalid choices format: {data['choices']}")
+                if pending.strip():
+                    speech_job.add(pending.strip())
                 
-            ai_response = data['choices'][0].get('message', {}).get('content')
-            if not ai_response:
-                raise ValueError(f"No content in response: {data}")
-            
-            print(f"Generated AI response: {ai_response[:100]}...")  # Log first 100 chars
-            
-            # Add AI response to chat history
-            chat_history.append({"role": "assistant", "content": ai_response})
-            
-            # Convert response to speech
-            try:
-                tts = gTTS(text=ai_response, lang='en')
-                audio_buffer = BytesIO()
-                tts.write_to_fp(audio_buffer)
-                audio_buffer.seek(0)
-                audio_base64 = base64.b64encode(audio_buffer.read()).decode('utf-8')
+                ai_response = ''.join(parts).strip()
+                if not ai_response:
+                    raise ValueError("No content in response")
+                
+                logger.debug("Generated AI response: %.100s...", ai_response)
                 
-                return jsonify({
-                    'text': ai_response,
-                    'audio': audio_base64
-                })
-            except Exception as tts_error:
-                print(f"TTS Error: {str(tts_error)}")
-                return jsonify({
-                    'text': ai_response,
-                    'audio': None,
-                    'error': f"Text-to-speech error: {str(tts_error)}"
-                })
-        else:
-            error_msg = f"OpenRouter API error: {response.status_code} - {response.text}"
-            print(error_msg)
-            return jsonify({'error': error_msg}), 500
+                # Record the completed turn in this session's history
+                history_store.append(session_id, user_message, {"role": "assistant", "content": ai_response})
+                yield sse_event({'done': True, 'text': ai_response})
+                
+                # Embedding the prompt for the cache happens after the client has the reply
+                response_cache.put(user_input, ai_response, history)
+            except Exception as e:
+                logger.exception("Error streaming chat response")
+                yield sse_event({'error': str(e)})
+            finally:
+                speech_job.close()
+                deltas.close()
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
             
     except Exception as e:
-        import traceback
-        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
+        logger.exception("Error processing input")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/audio/<token>', methods=['GET'])
+def audio(token):
+    """Stream the MP3 for a reply, sentence by sentence as it is synthesized."""
+    speech_job = tts.get_speech_job(token)
+    if speech_job is None:
+        return jsonify({'error': 'Audio not found or expired'}), 404
+
+    def generate():
+        try:
+            for mp3_bytes in speech_job:
+                yield mp3_bytes
+        except Exception:
+            # Headers are already sent at this point; the client just sees
+            # the audio end early.
+            logger.exception("TTS Error")
+
+    return Response(stream_with_context(generate()), mimetype='audio/mpeg')
+
 @app.route('/transcribe_audio', methods=['POST'])
 def transcribe_audio():
     """Transcribe audio using backend Whisper STT engine."""
@@ -139,105 +225,64 @@ def transcribe_audio():
         if audio_file.filename == '':
             return jsonify({'error': 'No audio file selected'}), 400
         
-        # Save uploaded audio to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_audio:
-            audio_file.save(temp_audio.name)
-            temp_audio_path = temp_audio.name
+        import av
+        from faster_whisper import decode_audio
+
+        try:
+            # Decode webm/mp3/wav straight to 16 kHz mono float32 with PyAV,
+            # without a temp file or an ffmpeg subprocess
+            pcm = decode_audio(audio_file.stream, sampling_rate=16000)
+        except av.error.FFmpegError as e:
+            return jsonify({'error': f'Could not decode audio: {str(e)}'}), 400
         
         try:
-            # Use speech_recognition to process the audio
-            recognizer = sr.Recognizer()
-            
-            # Convert audio file to format recognized by speech_recognition
-            from pydub import AudioSegment
-            
-            # Load audio file (handles webm, mp3, wav, etc.)
-            audio_segment = AudioSegment.from_file(temp_audio_path)
-            
-            # Convert to WAV format (16kHz, mono) for Whisper
-            wav_io = BytesIO()
-            audio_segment.export(wav_io, format="wav")
-            wav_io.seek(0)
-            
-            # Use Whisper for transcription
-            with sr.AudioFile(wav_io) as source:
-                audio_data = recognizer.record(source)
-                text = recognizer.recognize_whisper(
-                    audio_data,
-                    model="base",
-                    language="english"
-                )
-            
-            print(f"Transcribed text: {text}")
-            return jsonify({'text': text.strip()})
-            
-        except sr.UnknownValueError:
-            return jsonify({'error': 'Could not understand audio. Please speak more clearly.'}), 400
-        except sr.RequestError as e:
-            return jsonify({'error': f'Speech recognition service error: {str(e)}'}), 500
+            with whisper_lock:
+                stt = get_stt()
+            # Concurrent uploads are encoded and decoded together in one batch
+            text = stt.transcribe(pcm)
         except Exception as e:
-            print(f"Transcription error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Transcription error")
             return jsonify({'error': f'Transcription failed: {str(e)}'}), 500
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_audio_path):
-                os.unlink(temp_audio_path)
+        
+        if not text:
+            return jsonify({'error': 'Could not understand audio. Please speak more clearly.'}), 400
+        
+        logger.debug("Transcribed text: %s", text)
+        return jsonify({'text': text})
                 
     except Exception as e:
-        import traceback
-        error_msg = f"Error processing audio: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
+        logger.exception("Error processing audio")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/test_api', methods=['GET'])
 def test_api():
     try:
-        print("\n=== Testing OpenRouter API ===")
-        print(f"Using API key: {OPENROUTER_API_KEY[:5]}...{OPENROUTER_API_KEY[-5:]}")
-        
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        logger.info("Testing OpenRouter API with key %s...%s", OPENROUTER_API_KEY[:5], OPENROUTER_API_KEY[-5:])
         
         # Test with a simple prompt
-        payload = {
-            "model": MODEL,
-            "messages": [{"role": "user", "content": "Say 'test successful'"}]
-        }
-        
-        print("Sending request to OpenRouter...")
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
-        
-        if response.status_code == 200:
-            return jsonify({
-                "status": "success",
-                "response": response.json()
-            })
-        else:
+        try:
+            reply = openrouter_client.chat([{"role": "user", "content": "Say 'test successful'"}],
+                                           MODEL, api_key=OPENROUTER_API_KEY, timeout=10)
+        except openrouter_client.OpenRouterError as e:
+            logger.info("OpenRouter test status: %s", e.response.status_code)
             return jsonify({
                 "status": "error",
-                "status_code": response.status_code,
-                "response": response.text
+                "status_code": e.response.status_code,
+                "response": e.response.text
             }), 500
+        
+        logger.info("OpenRouter test status: 200")
+        return jsonify({
+            "status": "success",
+            "response": reply
+        })
             
     except Exception as e:
-        import traceback
-        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
+        logger.exception("Error testing OpenRouter API")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
     print("\n=== Starting EchoMind Server ===")
     print(f"Debug mode: {app.debug}")
     print(f"OpenRouter API Key: {'Set' if OPENROUTER_API_KEY else 'Not set'}")
@@ -245,4 +290,4 @@ if __name__ == '__main__':
     print("Server running on http://127.0.0.1:5000")
     print("Test API endpoint: http://127.0.0.1:5000/test_api")
     print("==============================\n")
-    app.run(debug=True, port=5000)
+    app.run(port=5000, threaded=True)
@@ -1,8 +1,12 @@
 import pyaudio
 import numpy as np
 import webrtcvad
-from collections import deque
-import time
+import threading
+
+# WebRTC VAD only accepts 10, 20 or 30 ms frames
+VAD_FRAME_MS = 30
+# Longest utterance record_until_silence keeps (Whisper's 30 s window)
+MAX_RECORD_SEC = 30
 
 class AudioCapture:
     def __init__(self, sample_rate=16000, chunk_size=1024, channels=1, format=pyaudio.paInt16):
@@ -22,7 +26,24 @@ class AudioCapture:
         self.audio = pyaudio.PyAudio()
         self.stream = None
         self.vad = webrtcvad.Vad(3)  # Aggressiveness mode (0-3)
-        self.audio_buffer = deque(maxlen=sample_rate * 5)  # 5 second buffer
+        
+        # 5 second int16 ring buffer filled by the stream callback. The indices
+        # count samples written/read since start; positions wrap modulo the size.
+        self.buffer_size = sample_rate * 5
+        self.ring = np.zeros(self.buffer_size, dtype=np.int16)
+        self.write_idx = 0
+        self.read_idx = 0
+        self._ring_lock = threading.Lock()
+        self._data_ready = threading.Condition(self._ring_lock)
+        # Set while the assistant's own speech is playing; recording then
+        # discards everything the microphone hears
+        self._muted = threading.Event()
+        
+        self.frame_samples = sample_rate * VAD_FRAME_MS // 1000
+        self.frame_bytes = self.frame_samples * np.dtype(np.int16).itemsize
+        
+        # Speech frames of the current recording are written here, allocated once
+        self.record_buffer = np.empty(sample_rate * MAX_RECORD_SEC, dtype=np.int16)
         
     def start(self):
         """Start the audio stream."""
@@ -41,29 +62,103 @@ class AudioCapture:
         if self.stream:
             self.stream.stop_stream()
             self.stream.close()
+            self.stream = None
         self.audio.terminate()
     
     def _callback(self, in_data, frame_count, time_info, status):
         """Callback function for audio stream."""
         audio_data = np.frombuffer(in_data, dtype=np.int16)
-        self.audio_buffer.extend(audio_data)
+        with self._data_ready:
+            self._write_ring(audio_data)
+            self._data_ready.notify_all()
         return (in_data, pyaudio.paContinue)
     
+    def _write_ring(self, audio_data):
+        """Copy samples into the ring buffer, overwriting the oldest unread ones when full."""
+        n = len(audio_data)
+        if n > self.buffer_size:
+            audio_data = audio_data[-self.buffer_size:]
+            self.write_idx += n - self.buffer_size
+            n = self.buffer_size
+        
+        pos = self.write_idx % self.buffer_size
+        first = min(n, self.buffer_size - pos)
+        self.ring[pos:pos + first] = audio_data[:first]
+        self.ring[:n - first] = audio_data[first:]
+        self.write_idx += n
+        
+        if self.write_idx - self.read_idx > self.buffer_size:
+            self.read_idx = self.write_idx - self.buffer_size
+    
+    def _read_ring(self, n):
+        """Return a copy of the next n unread samples from the ring buffer."""
+        pos = self.read_idx % self.buffer_size
+        if pos + n <= self.buffer_size:
+            samples = self.ring[pos:pos + n].copy()
+        else:
+            samples = np.concatenate((self.ring[pos:], self.ring[:pos + n - self.buffer_size]))
+        self.read_idx += n
+        return samples
+    
     def get_audio_chunk(self):
         """Get the next chunk of audio data."""
         if not self.stream or not self.stream.is_active():
             return None
         
         # Get audio data from buffer
-        if len(self.audio_buffer) >= self.chunk_size:
-            return np.array([self.audio_buffer.popleft() for _ in range(self.chunk_size)])
+        with self._ring_lock:
+            if self.write_idx - self.read_idx >= self.chunk_size:
+                return self._read_ring(self.chunk_size)
         return None
     
+    def _read_frames(self, min_frames, timeout):
+        """
+        Wait until at least min_frames whole VAD frames are buffered.
+        
+        Returns:
+            numpy.ndarray: All buffered whole frames as one contiguous array,
+            or None if nothing arrived before the timeout.
+        """
+        with self._data_ready:
+            self._data_ready.wait_for(
+                lambda: self.write_idx - self.read_idx >= min_frames * self.frame_samples,
+                timeout=timeout
+            )
+            available = (self.write_idx - self.read_idx) // self.frame_samples
+            if available == 0:
+                return None
+            return self._read_ring(available * self.frame_samples)
+    
+    def clear_buffer(self):
+        """Drop all buffered audio that has not been read yet."""
+        with self._ring_lock:
+            self.read_idx = self.write_idx
+    
+    def mute(self):
+        """Discard microphone input, including a recording in progress, until unmute()."""
+        self._muted.set()
+    
+    def unmute(self):
+        """Resume recording, dropping anything buffered while muted."""
+        self.clear_buffer()
+        self._muted.clear()
+    
     def is_speech(self, audio_chunk):
-        """Detect if the audio chunk contains speech using WebRTC VAD."""
-        if audio_chunk is None or len(audio_chunk) < 480:  # 30ms of 16kHz audio
+        """
+        Detect if the audio chunk contains speech using WebRTC VAD.
+        
+        Args:
+            audio_chunk: int16 samples as a numpy array, or raw 16-bit PCM as a
+                bytes-like object. Neither is copied before being handed to VAD.
+        """
+        if audio_chunk is None:
+            return False
+        if isinstance(audio_chunk, np.ndarray):
+            audio_chunk = np.ascontiguousarray(audio_chunk, dtype=np.int16)
+        frame = memoryview(audio_chunk).cast('B')
+        if len(frame) < self.frame_bytes:  # 30ms of audio
             return False
-        return self.vad.is_speech(audio_chunk.tobytes(), self.sample_rate)
+        return self.vad.is_speech(frame, self.sample_rate)
     
     def record_until_silence(self, silence_duration=1.0, chunk_duration=0.1):
         """
@@ -76,35 +171,56 @@ class AudioCapture:
         Returns:
             numpy.ndarray: Recorded audio data
         """
-        chunk_size = int(self.sample_rate * chunk_duration)
-        silence_threshold = int(silence_duration / chunk_duration)
+        frame_duration = self.frame_samples / self.sample_rate
+        silence_threshold = int(silence_duration / frame_duration)
+        frames_per_batch = max(1, int(chunk_duration / frame_duration))
         silent_chunks = 0
-        audio_frames = []
+        write_pos = 0
+        
+        # Hoisted out of the per-frame loop
+        frame_samples = self.frame_samples
+        frame_bytes = self.frame_bytes
+        sample_rate = self.sample_rate
+        vad_is_speech = self.vad.is_speech
+        record_buffer = self.record_buffer
+        max_samples = len(record_buffer) - len(record_buffer) % frame_samples
         
         try:
             print("Listening... (speak now)")
-            while silent_chunks < silence_threshold:
-                chunk = self.get_audio_chunk()
-                if chunk is not None:
-                    if self.is_speech(chunk):
-                        audio_frames.append(chunk)
+            # Also ends when stop() is called from another thread
+            while silent_chunks < silence_threshold and write_pos < max_samples and self.stream is not None:
+                # Blocks until the stream callback has delivered enough audio
+                samples = self._read_frames(frames_per_batch, timeout=chunk_duration * 2)
+                if self._muted.is_set():
+                    # Playback started: whatever was recorded may contain the
+                    # assistant's own voice, so start over once unmuted
+                    write_pos = 0
+                    silent_chunks = 0
+                    continue
+                if samples is None:
+                    continue
+                
+                # VAD reads each 30 ms frame straight out of the batch, no per-frame copy
+                view = memoryview(samples).cast('B')
+                for i, offset in enumerate(range(0, len(view), frame_bytes)):
+                    if vad_is_speech(view[offset:offset + frame_bytes], sample_rate):
+                        record_buffer[write_pos:write_pos + frame_samples] = samples[i * frame_samples:(i + 1) * frame_samples]
+                        write_pos += frame_samples
                         silent_chunks = 0
                         print(".", end="", flush=True)
-                    else:
-                        if len(audio_frames) > 0:  # Only count silence after speech started
-                            silent_chunks += 1
-                    
-                    # Maintain a reasonable buffer size
-                    if len(audio_frames) > 30:  # ~3 seconds at 100ms chunks
-                        audio_frames.pop(0)
-                
-                time.sleep(chunk_duration / 2)  # Small delay to prevent busy waiting
+                        # Stop at the buffer limit rather than dropping speech
+                        if write_pos == max_samples:
+                            break
+                    elif write_pos > 0:  # Only count silence after speech started
+                        silent_chunks += 1
+                        if silent_chunks >= silence_threshold:
+                            break
                 
         except KeyboardInterrupt:
             print("\nRecording stopped by user")
         
         print("\nFinished recording")
-        return np.concatenate(audio_frames) if audio_frames else np.array([])
+        return record_buffer[:write_pos].copy()
 
     def __enter__(self):
         """Context manager entry."""
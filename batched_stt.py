@@ -0,0 +1,166 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_compression_ratio, get_suppressed_tokens
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+
+
+class BatchedSTT:
+    """
+    Transcribes clips from concurrent callers in shared Whisper batches.
+
+    Requests arriving within max_wait of each other are run through the
+    encoder and greedy decoder as one batch instead of one after another.
+    Whisper's encoder always takes a 30 s window, so clips of any length up
+    to that pad to the same shape and batch together; longer clips fall back
+    to a regular, unbatched transcription. Silence is cut out with Silero VAD
+    and the log-Mel features are computed on the caller's thread before a
+    clip is queued, so more clips fit the window and clips without speech
+    never reach the model.
+
+    The batch is decoded greedily, without model.transcribe's beam search
+    and temperature fallback. A clip whose greedy result fails the same
+    checks transcribe uses (compression ratio above 2.4, which catches
+    repetition loops, average log-probability below -1, or hitting the
+    length limit) is transcribed again with model.transcribe's defaults.
+    """
+    COMPRESSION_RATIO_THRESHOLD = 2.4
+    LOG_PROB_THRESHOLD = -1.0
+    NO_SPEECH_THRESHOLD = 0.6
+
+    def __init__(self, model: WhisperModel, max_batch_size: int = 8, max_wait: float = 0.05,
+                 language: str = "en"):
+        """
+        Start the batching worker for a loaded model.
+
+        Args:
+            model (WhisperModel): faster-whisper model shared by all callers.
+            max_batch_size (int): Most clips transcribed in one batch.
+            max_wait (float): Seconds to wait for more requests after the first one arrives.
+            language (str): Language code all clips are transcribed in.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.language = language
+        self.logger = logging.getLogger(__name__)
+
+        self.tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                                   task="transcribe", language=language)
+        self.prompt = model.get_prompt(self.tokenizer, previous_tokens=[], without_timestamps=True)
+        self.suppress_tokens = list(get_suppressed_tokens(self.tokenizer, [-1]))
+        self.n_samples = model.feature_extractor.n_samples
+        self.n_frames = model.feature_extractor.nb_max_frames
+        self.vad_options = VadOptions()
+
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="batched-stt", daemon=True)
+        self._worker.start()
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        """
+        Transcribe a clip, sharing a batch with any concurrent callers.
+
+        Args:
+            audio (numpy.ndarray): 16 kHz mono float32 samples in [-1, 1].
+
+        Returns:
+            str: The transcribed text, stripped.
+        """
+        # VAD and feature extraction run on the caller's thread, in parallel with other requests
+        audio = self._vad_trim(audio)
+        if audio.size == 0:
+            return ""
+
+        features = None
+        if len(audio) <= self.n_samples:
+            features = pad_or_trim(self.model.feature_extractor(audio)[:, :self.n_frames], self.n_frames)
+
+        future = Future()
+        self._requests.put((audio, features, future))
+        return future.result()
+
+    def _vad_trim(self, audio: np.ndarray) -> np.ndarray:
+        """Return only the speech regions of the clip, joined together."""
+        speech_chunks = get_speech_timestamps(audio, self.vad_options)
+        if not speech_chunks:
+            return audio[:0]
+        clips, _ = collect_chunks(audio, speech_chunks)
+        return clips[0]
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            short = [request for request in batch if request[1] is not None]
+            long = [request for request in batch if request[1] is None]
+            if short:
+                self._complete(short, self._transcribe_batch)
+            for request in long:
+                self._complete([request], self._transcribe_full)
+
+    def _complete(self, requests, transcribe):
+        try:
+            texts = transcribe(requests)
+        except Exception as e:
+            self.logger.error(f"Batched transcription error: {str(e)}")
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        for (_, _, future), text in zip(requests, texts):
+            future.set_result(text)
+
+    def _transcribe_batch(self, requests) -> List[str]:
+        encoder_output = self.model.encode(np.stack([features for _, features, _ in requests]))
+        results = self.model.model.generate(
+            encoder_output,
+            [self.prompt] * len(requests),
+            beam_size=1,
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=self.suppress_tokens,
+            return_scores=True,
+            return_no_speech_prob=True
+        )
+        self.logger.debug(f"Transcribed a batch of {len(requests)} clips")
+
+        texts = []
+        for request, result in zip(requests, results):
+            tokens = result.sequences_ids[0]
+            text = self.tokenizer.decode(tokens).strip()
+            # Same normalisation as faster-whisper: the score is the cumulative
+            # log-probability divided by the length
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            if result.no_speech_prob > self.NO_SPEECH_THRESHOLD and avg_logprob < self.LOG_PROB_THRESHOLD:
+                texts.append("")
+            elif (get_compression_ratio(text) > self.COMPRESSION_RATIO_THRESHOLD
+                  or avg_logprob < self.LOG_PROB_THRESHOLD
+                  or len(self.prompt) + len(tokens) >= self.model.max_length):
+                self.logger.debug("Greedy batch result rejected, retranscribing the clip")
+                texts.extend(self._transcribe_full([request]))
+            else:
+                texts.append(text)
+        return texts
+
+    def _transcribe_full(self, requests) -> List[str]:
+        """Transcribe one clip with model.transcribe's defaults: beam search and temperature fallback."""
+        audio, _, _ = requests[0]
+        segments, _ = self.model.transcribe(audio, language=self.language)
+        return ["".join(segment.text for segment in segments).strip()]
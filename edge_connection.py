@@ -0,0 +1,199 @@
+import time
+import asyncio
+import threading
+import logging
+from typing import AsyncIterator, Optional
+
+import aiohttp
+import edge_tts
+from edge_tts.communicate import (
+    DRM, SEC_MS_GEC_VERSION, WSS_HEADERS, WSS_URL, _SSL_CTX,
+    connect_id, date_to_string, get_headers_and_data, mkssml, ssml_headers_plus_data
+)
+from edge_tts.exceptions import NoAudioReceived, UnexpectedResponse, WebSocketError
+
+
+class EdgeTTSConnection:
+    """
+    One long-lived Edge-TTS WebSocket that synthesis requests are sent over in turn.
+
+    edge_tts.Communicate opens a new session and WebSocket (DNS, TCP, TLS and
+    the upgrade) for every call. This keeps the socket open between requests
+    and only reconnects when it drops or when its Sec-MS-GEC token is about to
+    expire. A connection belongs to the first event loop that uses it; using it
+    from another loop while that one is still open raises RuntimeError.
+    """
+    # The Sec-MS-GEC token in the connection URL is valid for five minutes
+    MAX_AGE = 240
+    RECEIVE_TIMEOUT = 60
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bind_lock = threading.Lock()
+        self.lock: Optional[asyncio.Lock] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.websocket: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.opened = 0.0
+
+    async def stream(self, text: str, voice: str) -> AsyncIterator[bytes]:
+        """
+        Synthesize text and yield the MP3 audio as it arrives.
+
+        Args:
+            text (str): Text to convert to speech
+            voice (str): Edge-TTS voice name, e.g. 'en-US-AriaNeural'
+
+        Yields:
+            bytes: Chunks of 24 kHz mono MP3 audio, in order.
+        """
+        # Communicate validates the voice and splits and escapes the text
+        communicate = edge_tts.Communicate(text, voice)
+
+        self._bind_loop()
+        async with self.lock:
+            for part in communicate.texts:
+                received = False
+                for attempt in range(2):
+                    await self._ensure_connected()
+                    try:
+                        async for data in self._synthesize(communicate.tts_config, part):
+                            received = True
+                            yield data
+                        break
+                    except (aiohttp.ClientError, WebSocketError, UnexpectedResponse,
+                            NoAudioReceived, asyncio.TimeoutError):
+                        await self._close_websocket()
+                        # The server may have dropped an idle socket; retry once
+                        # on a fresh one unless audio was already delivered
+                        if received or attempt:
+                            raise
+                        self.logger.debug("Edge-TTS connection lost, reconnecting")
+                    except BaseException:
+                        # Abandoned mid-turn (the consumer stopped early or was
+                        # cancelled): the rest of this turn's frames are still
+                        # on the socket, so it must not serve the next request
+                        await self._close_websocket()
+                        raise
+
+    async def connect(self):
+        """Open the WebSocket ahead of the first request, if it is not open already."""
+        self._bind_loop()
+        async with self.lock:
+            await self._ensure_connected()
+
+    async def close(self):
+        """Close the WebSocket and the HTTP session."""
+        await self._close_websocket()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        with self._bind_lock:
+            if self.loop is loop:
+                return
+            # aiohttp sessions are bound to the loop that created them
+            if self.loop is not None and not self.loop.is_closed():
+                raise RuntimeError("EdgeTTSConnection is already in use on another event loop")
+            # The previous loop is closed, and with it the old session and socket
+            self.loop = loop
+            self.lock = asyncio.Lock()
+            self.session = None
+            self.websocket = None
+
+    async def _ensure_connected(self):
+        if self.websocket is not None and not self.websocket.closed \
+                and time.monotonic() - self.opened < self.MAX_AGE:
+            return
+        await self._close_websocket()
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                trust_env=True,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10)
+            )
+        try:
+            self.websocket = await self._open_websocket()
+        except aiohttp.ClientResponseError as e:
+            if e.status != 403:
+                raise
+            # Correct the clock skew the token is derived from, then retry
+            DRM.handle_client_response_error(e)
+            self.websocket = await self._open_websocket()
+        self.opened = time.monotonic()
+
+        await self.websocket.send_str(
+            f"X-Timestamp:{date_to_string()}\r\n"
+            "Content-Type:application/json; charset=utf-8\r\n"
+            "Path:speech.config\r\n\r\n"
+            '{"context":{"synthesis":{"audio":{"metadataoptions":{'
+            '"sentenceBoundaryEnabled":"true","wordBoundaryEnabled":"false"'
+            "},"
+            '"outputFormat":"audio-24khz-48kbitrate-mono-mp3"'
+            "}}}}\r\n"
+        )
+
+    async def _open_websocket(self) -> aiohttp.ClientWebSocketResponse:
+        return await self.session.ws_connect(
+            f"{WSS_URL}&ConnectionId={connect_id()}"
+            f"&Sec-MS-GEC={DRM.generate_sec_ms_gec()}"
+            f"&Sec-MS-GEC-Version={SEC_MS_GEC_VERSION}",
+            compress=15,
+            headers=DRM.headers_with_muid(WSS_HEADERS),
+            ssl=_SSL_CTX
+        )
+
+    async def _close_websocket(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+            self.websocket = None
+
+    async def _synthesize(self, tts_config, part: bytes) -> AsyncIterator[bytes]:
+        """
+        Send one SSML request and yield its audio until the service ends the turn.
+
+        Raises:
+            NoAudioReceived: If the turn ended without any audio.
+            UnexpectedResponse: If a binary message is not well-formed audio.
+            WebSocketError: If the connection closes or errors mid-turn.
+        """
+        await self.websocket.send_str(
+            ssml_headers_plus_data(connect_id(), date_to_string(), mkssml(tts_config, part))
+        )
+        audio_received = False
+        while True:
+            received = await self.websocket.receive(timeout=self.RECEIVE_TIMEOUT)
+            if received.type == aiohttp.WSMsgType.TEXT:
+                encoded_data = received.data.encode("utf-8")
+                parameters, _ = get_headers_and_data(encoded_data, encoded_data.find(b"\r\n\r\n"))
+                if parameters.get(b"Path") == b"turn.end":
+                    break
+            elif received.type == aiohttp.WSMsgType.BINARY:
+                # Same validation as edge_tts.Communicate
+                if len(received.data) < 2:
+                    raise UnexpectedResponse("Binary message is missing the header length")
+                header_length = int.from_bytes(received.data[:2], "big")
+                if header_length > len(received.data):
+                    raise UnexpectedResponse("Binary message header length exceeds its size")
+                parameters, data = get_headers_and_data(received.data, header_length)
+                if parameters.get(b"Path") != b"audio":
+                    raise UnexpectedResponse("Binary message path is not audio")
+                content_type = parameters.get(b"Content-Type")
+                if content_type is None:
+                    # The service ends the audio stream with an empty, untyped message
+                    if data:
+                        raise UnexpectedResponse("Binary message has data but no Content-Type")
+                    continue
+                if content_type != b"audio/mpeg":
+                    raise UnexpectedResponse(f"Unexpected audio Content-Type {content_type!r}")
+                if not data:
+                    raise UnexpectedResponse("Binary audio message has no data")
+                audio_received = True
+                yield data
+            else:
+                raise WebSocketError(f"Edge-TTS connection closed ({received.type.name})")
+
+        if not audio_received:
+            raise NoAudioReceived("Edge-TTS ended the turn without sending audio")
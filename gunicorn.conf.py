@@ -0,0 +1,19 @@
+"""
+Gunicorn settings for serving EchoMind in production:
+
+    gunicorn app:app
+
+Clip handles from /chat are served by /audio/<token> out of the process that
+synthesizes them, and each process loads its own Whisper model, so a single
+worker with a thread per concurrent request is the default. Chat and TTS time
+is spent waiting on OpenRouter and Google, which releases the GIL.
+"""
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+# Streamed replies keep a request open while the LLM generates
+timeout = 120
+keepalive = 5
@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict
+
+import orjson
+import redis
+
+
+def _trim_length(length: int, max_messages: int) -> int:
+    """
+    Return how many of the newest messages to keep, or 0 to keep everything.
+
+    Older turns are dropped in one block down to half the limit rather than one
+    pair per turn, so the prefix sent to OpenRouter stays byte-identical between
+    trims and provider-side prompt caching keeps hitting.
+    """
+    if length <= max_messages:
+        return 0
+    keep = max_messages // 2
+    return keep - keep % 2  # whole user/assistant pairs only
+
+
+class MemoryHistory:
+    """
+    Per-session conversation history held in this process.
+
+    Like RedisHistory, a session expires after ttl seconds without a new
+    message. At most max_sessions are kept, the least recently active being
+    dropped first, so abandoned session cookies do not accumulate.
+    """
+    def __init__(self, max_messages: int = 50, ttl: int = 24 * 60 * 60, max_sessions: int = 10000):
+        """
+        Args:
+            max_messages (int): Messages kept per session before the oldest turns are dropped.
+            ttl (int): Seconds of inactivity after which a session's history expires.
+            max_sessions (int): Sessions kept before the least recently active is dropped.
+        """
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # Ordered from least to most recently appended to
+        self._sessions: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Return a copy of the session's messages, oldest first."""
+        with self._lock:
+            self._evict()
+            return list(self._sessions.get(session_id, []))
+
+    def append(self, session_id: str, *messages: Dict[str, str]):
+        """Append messages to the session and trim it to max_messages."""
+        with self._lock:
+            history = self._sessions.setdefault(session_id, [])
+            self._sessions.move_to_end(session_id)
+            self._expires[session_id] = time.monotonic() + self.ttl
+            history.extend(messages)
+            keep = _trim_length(len(history), self.max_messages)
+            if keep:
+                del history[:len(history) - keep]
+            self._evict()
+
+    def _evict(self):
+        """Drop expired sessions and any beyond max_sessions, oldest first."""
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if len(self._sessions) <= self.max_sessions and self._expires[oldest] > now:
+                break
+            del self._sessions[oldest]
+            del self._expires[oldest]
+
+
+class RedisHistory:
+    """Per-session conversation history stored in Redis lists, shared by all workers."""
+    def __init__(self, url: str, max_messages: int = 50, ttl: int = 24 * 60 * 60,
+                 prefix: str = "echomind:history:"):
+        """
+        Args:
+            url (str): Redis connection URL, e.g. redis://localhost:6379/0.
+            max_messages (int): Messages kept per session before the oldest turns are dropped.
+            ttl (int): Seconds of inactivity after which a session's history expires.
+            prefix (str): Key prefix for the per-session lists.
+        """
+        self.client = redis.Redis.from_url(url)
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Return the session's messages, oldest first."""
+        return [orjson.loads(item) for item in self.client.lrange(self.prefix + session_id, 0, -1)]
+
+    def append(self, session_id: str, *messages: Dict[str, str]):
+        """Append messages to the session and trim it to max_messages."""
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.rpush(key, *(orjson.dumps(message) for message in messages))
+        pipe.expire(key, self.ttl)
+        length = pipe.execute()[0]
+
+        keep = _trim_length(length, self.max_messages)
+        if keep:
+            self.client.ltrim(key, -keep, -1)
+
+
+def create_history_store(max_messages: int = 50):
+    """Use Redis when REDIS_URL is set, otherwise fall back to in-process storage."""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        return RedisHistory(redis_url, max_messages=max_messages)
+    return MemoryHistory(max_messages=max_messages)
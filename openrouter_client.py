@@ -0,0 +1,101 @@
+import os
+from typing import List, Dict, Iterator, Union
+
+import requests
+import orjson
+from requests.adapters import HTTPAdapter
+
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Shared HTTP session so every OpenRouter call reuses pooled keep-alive
+# connections instead of paying a TCP + TLS handshake per request.
+# The session advertises gzip/deflate, plus br once the brotli package is
+# installed, and decodes compressed responses (streamed SSE included)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+
+class OpenRouterError(requests.exceptions.HTTPError):
+    """OpenRouter answered with a non-200 status."""
+
+
+class ChatStream:
+    """Content deltas of a streamed chat completion; close() releases the connection."""
+    def __init__(self, response: requests.Response):
+        self.response = response
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.response.iter_lines():
+            # Skip keep-alive comments and blank separators between events
+            if not line.startswith(b"data: "):
+                continue
+            data = line[len(b"data: "):]
+            if data == b"[DONE]":
+                break
+
+            chunk = orjson.loads(data)
+            if "error" in chunk:
+                raise ValueError(f"OpenRouter stream error: {chunk['error']}")
+            if not chunk.get("choices"):
+                continue
+
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def chat(messages: List[Dict[str, str]], model: str, stream: bool = False, api_key: str = None,
+         timeout: float = 30, **params) -> Union[str, ChatStream]:
+    """
+    Send a chat completion request to OpenRouter.
+
+    Args:
+        messages: List of message dictionaries with 'role' and 'content' keys.
+        model: OpenRouter model id, e.g. 'openai/gpt-3.5-turbo'.
+        stream: Stream the completion instead of waiting for the full reply.
+        api_key: OpenRouter API key. If None, OPENROUTER_API_KEY is used.
+        timeout: Seconds to wait for the connection and between received bytes.
+        **params: Additional parameters to pass to the API (temperature, max_tokens, etc.)
+
+    Returns:
+        str: The reply text, or a ChatStream of its content deltas when stream is True.
+
+    Raises:
+        OpenRouterError: If OpenRouter answers with a non-200 status.
+        ValueError: If the reply has no choices.
+    """
+    api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://echomind-ai-assistant.com",  # Optional, for tracking
+        "X-Title": "EchoMind Voice Assistant"  # Optional, shown in rankings on openrouter.ai
+    }
+    payload = {"model": model, "messages": messages, **params}
+    if stream:
+        payload["stream"] = True
+
+    response = SESSION.post(API_URL, headers=headers, data=orjson.dumps(payload),
+                            timeout=timeout, stream=stream)
+    if response.status_code != 200:
+        # Read the body before closing so callers can still inspect it
+        error_msg = f"OpenRouter API error: {response.status_code} - {response.text}"
+        response.close()
+        raise OpenRouterError(error_msg, response=response)
+
+    if stream:
+        return ChatStream(response)
+
+    result = orjson.loads(response.content)
+    if not result.get("choices"):
+        raise ValueError(f"Unexpected response format: {result}")
+    return result["choices"][0]["message"]["content"].strip()
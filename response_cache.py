@@ -0,0 +1,169 @@
+import os
+import json
+import base64
+import logging
+import threading
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+import numpy as np
+
+
+class ResponseCache:
+    """
+    Semantic cache of assistant replies keyed on the recent conversation.
+
+    Prompts are embedded together with the system prompt and the last few
+    turns, so a near-duplicate question asked in the same context reuses the
+    earlier reply instead of going back to the LLM.
+    """
+    def __init__(self, cache_dir: str = "cache/responses", model_name: str = "all-MiniLM-L6-v2",
+                 threshold: float = 0.9, history_turns: int = 2, max_entries: int = 10000):
+        """
+        Initialize the cache and load any entries persisted in cache_dir.
+
+        Args:
+            cache_dir (str): Directory where embeddings and replies are stored.
+            model_name (str): sentence-transformers model used for embeddings.
+            threshold (float): Minimum cosine similarity for a cache hit.
+            history_turns (int): Number of previous user/assistant pairs included in the key.
+            max_entries (int): Entries kept before the oldest tenth is evicted.
+        """
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.threshold = threshold
+        self.history_turns = history_turns
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._embed = lru_cache(maxsize=128)(self._encode)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._entries_path = os.path.join(self.cache_dir, "entries.jsonl")
+        # Embeddings fill the first _count rows of _matrix, which grows by
+        # doubling so an insert does not copy every stored embedding
+        self._matrix = None
+        self._count = 0
+        self._responses = []
+        self._load()
+
+    def _load(self):
+        """Load persisted entries, skipping any partially written line."""
+        embeddings, responses = [], []
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    embeddings.append(np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float32))
+                    responses.append(entry["response"])
+
+        if not responses:
+            return
+        if len(responses) > self.max_entries:
+            embeddings, responses = embeddings[-self.max_entries:], responses[-self.max_entries:]
+        self._matrix = np.vstack(embeddings)
+        self._count = len(responses)
+        self._responses = responses
+        self.logger.info(f"Loaded {len(responses)} cached responses from {self.cache_dir}")
+
+    def _get_model(self):
+        # Loaded once even when several request threads miss the cache at the same time
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    def _encode(self, key_text: str) -> np.ndarray:
+        embedding = self._get_model().encode([key_text], normalize_embeddings=True)[0]
+        return np.asarray(embedding, dtype=np.float32)
+
+    def _key_text(self, user_input: str, history: Optional[List[Dict[str, str]]],
+                  system_prompt: Optional[str]) -> str:
+        parts = []
+        if system_prompt:
+            parts.append(f"system: {system_prompt.strip()}")
+        if history and self.history_turns > 0:
+            for message in history[-2 * self.history_turns:]:
+                parts.append(f"{message['role']}: {message['content'].strip()}")
+        parts.append(f"user: {' '.join(user_input.lower().split())}")
+        return "\n".join(parts)
+
+    def get(self, user_input: str, history: List[Dict[str, str]] = None,
+            system_prompt: str = None) -> Optional[str]:
+        """
+        Look up a cached reply for the prompt.
+
+        Args:
+            user_input: The user's input text.
+            history: Conversation messages preceding user_input.
+            system_prompt: Optional system message used for the conversation.
+
+        Returns:
+            str: The cached reply, or None if no entry is similar enough.
+        """
+        query = self._embed(self._key_text(user_input, history, system_prompt))
+        with self._lock:
+            if self._count == 0:
+                return None
+            # Embeddings are normalized, so the inner product is the cosine similarity
+            scores = self._matrix[:self._count] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self.logger.info(f"Response cache hit (score {scores[best]:.3f})")
+            return self._responses[best]
+
+    def put(self, user_input: str, response: str, history: List[Dict[str, str]] = None,
+            system_prompt: str = None):
+        """
+        Store a reply for the prompt and append it to the on-disk cache.
+
+        Args:
+            user_input: The user's input text.
+            response: The assistant's reply to cache.
+            history: Conversation messages preceding user_input.
+            system_prompt: Optional system message used for the conversation.
+        """
+        embedding = self._embed(self._key_text(user_input, history, system_prompt))
+        with self._lock:
+            if self._count >= self.max_entries:
+                self._evict()
+            if self._matrix is None:
+                self._matrix = np.empty((16, embedding.size), dtype=np.float32)
+            elif self._count == len(self._matrix):
+                grown = np.empty((2 * len(self._matrix), embedding.size), dtype=np.float32)
+                grown[:self._count] = self._matrix[:self._count]
+                self._matrix = grown
+            self._matrix[self._count] = embedding
+            self._count += 1
+            self._responses.append(response)
+
+            with open(self._entries_path, "a", encoding="utf-8") as f:
+                f.write(self._entry_line(embedding, response))
+
+    def _evict(self):
+        """Drop the oldest tenth of the entries and rewrite the on-disk cache without them."""
+        drop = max(1, self._count - int(self.max_entries * 0.9))
+        self._count -= drop
+        self._matrix[:self._count] = self._matrix[drop:drop + self._count]
+        del self._responses[:drop]
+
+        temp_path = f"{self._entries_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for embedding, response in zip(self._matrix[:self._count], self._responses):
+                f.write(self._entry_line(embedding, response))
+        os.replace(temp_path, self._entries_path)
+
+    @staticmethod
+    def _entry_line(embedding: np.ndarray, response: str) -> str:
+        return json.dumps({
+            "response": response,
+            "embedding": base64.b64encode(embedding.tobytes()).decode("ascii")
+        }) + "\n"
@@ -276,7 +276,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         try {
             // Send to server for processing
-            const response = await fetch('/process_input', {
+            const response = await fetch('/chat', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -289,27 +289,51 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.error || `Server error: ${response.status}`);
             }
             
-            const data = await response.json();
-            
-            // Remove typing indicator
-            typingIndicator.remove();
-            
-            if (data.error) {
-                throw new Error(data.error);
-            }
-            
-            // Add AI response to chat
-            addMessageToChat('ai', data.text);
+            // Read the streamed reply and render tokens as they arrive
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let messageText = null;
+            let finished = false;
             
-            // Play the audio response automatically
-            if (data.audio) {
-                audioPlayer.src = `data:audio/mp3;base64,${data.audio}`;
-                audioPlayer.play().catch(e => {
-                    console.error('Error playing audio:', e);
-                    updateStatusIndicator('Audio playback failed. Text response is available above.', 'error');
-                });
-            } else {
-                updateStatusIndicator('Response received (no audio)', 'info');
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    throw new Error('Connection closed before the response was complete');
+                }
+                buffer += decoder.decode(value, { stream: true });
+                
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const event of events) {
+                    if (!event.startsWith('data: ')) continue;
+                    const data = JSON.parse(event.slice('data: '.length));
+                    
+                    if (data.error) {
+                        throw new Error(data.error);
+                    }
+                    if (data.audio_url) {
+                        // Start the audio stream now; the browser begins playback
+                        // as soon as the first sentence has been synthesized
+                        audioPlayer.src = data.audio_url;
+                        audioPlayer.play().catch(e => {
+                            console.error('Error playing audio:', e);
+                            updateStatusIndicator('Audio playback failed. Text response is available above.', 'error');
+                        });
+                    }
+                    if (data.delta) {
+                        if (messageText === null) {
+                            // Replace the typing indicator with the AI message
+                            typingIndicator.remove();
+                            messageText = addMessageToChat('ai', '');
+                        }
+                        messageText.textContent += data.delta;
+                        chatContainer.scrollTop = chatContainer.scrollHeight;
+                    }
+                    if (data.done) {
+                        finished = true;
+                    }
+                }
             }
             
         } catch (error) {
@@ -346,6 +370,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         chatContainer.appendChild(messageDiv);
         chatContainer.scrollTop = chatContainer.scrollHeight;
+        return textNode;
     }
     
     function showTypingIndicator() {
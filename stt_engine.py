@@ -1,16 +1,72 @@
+import os
 import speech_recognition as sr
 import numpy as np
-import io
-from pydub import AudioSegment
 import logging
+import ctranslate2
+from faster_whisper import WhisperModel
+
+def available_cpus():
+    """
+    Return the number of CPUs this process may actually use.
+
+    Honours the scheduler affinity mask and a cgroup v2 CPU quota (as set by
+    docker --cpus or Kubernetes limits), both of which os.cpu_count() ignores.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS or Windows
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def physical_cpu_cores():
+    """
+    Return the number of physical CPU cores, not counting SMT siblings.
+
+    Falls back to the logical CPU count where /proc/cpuinfo is unavailable.
+    The result never exceeds available_cpus(), since /proc/cpuinfo lists
+    every core of the host, including ones a container may not use.
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            cores = set()
+            physical_id = None
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    cores.add((physical_id, value.strip()))
+        if cores:
+            return min(len(cores), available_cpus())
+    except OSError:
+        pass
+    return available_cpus()
+
+# Scale from int16 PCM to Whisper's float32 [-1, 1] input
+INT16_SCALE = np.float32(1.0 / 32768.0)
+
+WHISPER_SAMPLE_RATE = 16000
+# Longest utterance the reusable conversion buffer holds: 30 s at 16 kHz
+MAX_UTTERANCE_SAMPLES = WHISPER_SAMPLE_RATE * 30
 
 class STTEngine:
-    def __init__(self, model_name="whisper"):
+    def __init__(self, model_name="whisper", model_size="base", device=None, cpu_threads=None):
         """
         Initialize the Speech-to-Text engine.
         
         Args:
-            model_name (str): STT model to use ('whisper', 'google', or 'vosk')
+            model_name (str): STT model to use ('whisper' or 'google')
+            model_size (str): Whisper model size ('tiny', 'base', 'small', 'medium', or 'large-v3')
+            device (str): 'cuda' or 'cpu'. If None, uses CUDA when a GPU is available.
+            cpu_threads (int): Threads for CPU inference. If None, one per physical core.
         """
         self.recognizer = sr.Recognizer()
         self.recognizer.energy_threshold = 300  # Minimum audio energy for speech detection
@@ -18,9 +74,38 @@ class STTEngine:
         self.recognizer.non_speaking_duration = 0.5  # Seconds of non-speaking audio to keep on both sides of recording
         self.model_name = model_name
         
-        # Configure logging
-        logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
+        
+        # Whisper runs on one faster-whisper (CTranslate2) model kept for the
+        # engine's lifetime, instead of FP32 PyTorch
+        self.model = None
+        self._buf = None
+        if self.model_name.lower() == "whisper":
+            # Reused for every int16 -> float32 conversion instead of allocating
+            # a new array per utterance; clips are transcribed one at a time
+            self._buf = np.empty(MAX_UTTERANCE_SAMPLES, dtype=np.float32)
+            if device is None:
+                device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+            if device == "cuda":
+                # Half precision on the tensor cores; BF16 where the GPU has it (Ampere+)
+                supported = ctranslate2.get_supported_compute_types("cuda")
+                compute_type = "bfloat16" if "bfloat16" in supported else "float16"
+            else:
+                compute_type = "int8"
+            # The int8 decoder is memory-bound; one thread per physical core
+            # avoids SMT siblings contending for the same caches
+            if cpu_threads is None:
+                cpu_threads = physical_cpu_cores()
+            self.model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                                      cpu_threads=cpu_threads)
+            # Pay for the lazy Silero VAD load, the first allocations and, on a
+            # GPU, CUDA context and kernel initialization now rather than on the
+            # first utterance. VAD drops the silent second before the encoder,
+            # so the encoder is warmed by a second pass without it.
+            silence = np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)
+            for vad_filter in (True, False):
+                segments, _ = self.model.transcribe(silence, language="en", beam_size=1, vad_filter=vad_filter)
+                list(segments)
     
     def audio_to_text(self, audio_data, sample_rate=16000):
         """
@@ -28,55 +113,18 @@ class STTEngine:
         
         Args:
             audio_data (numpy.ndarray): Audio data as a numpy array
-            sample_rate (int): Sample rate of the audio data
+            sample_rate (int): Sample rate of the audio data; must be 16000 for Whisper
             
         Returns:
             str: Transcribed text, or None if transcription failed
+            
+        Raises:
+            ValueError: If Whisper is given audio at any rate other than 16 kHz.
         """
         if audio_data.size == 0:
             self.logger.warning("Empty audio data received for transcription")
             return None
-            
-        # Convert numpy array to AudioData
-        audio_segment = AudioSegment(
-            audio_data.tobytes(),
-            frame_rate=sample_rate,
-            sample_width=audio_data.dtype.itemsize,
-            channels=1
-        )
-        
-        # Convert to WAV format expected by SpeechRecognition
-        wav_data = io.BytesIO()
-        audio_segment.export(wav_data, format="wav")
-        wav_data.seek(0)
-        
-        with sr.AudioFile(wav_data) as source:
-            try:
-                audio = self.recognizer.record(source)
-                
-                if self.model_name.lower() == "whisper":
-                    text = self.recognizer.recognize_whisper(
-                        audio,
-                        model="base",  # Can be 'tiny', 'base', 'small', 'medium', or 'large'
-                        language="english"
-                    )
-                elif self.model_name.lower() == "google":
-                    text = self.recognizer.recognize_google(audio)
-                else:
-                    raise ValueError(f"Unsupported STT model: {self.model_name}")
-                
-                self.logger.info(f"STT Result: {text}")
-                return text.strip()
-                
-            except sr.UnknownValueError:
-                self.logger.warning("Speech recognition could not understand audio")
-                return None
-            except sr.RequestError as e:
-                self.logger.error(f"Could not request results from speech recognition service; {e}")
-                return None
-            except Exception as e:
-                self.logger.error(f"Error in speech recognition: {str(e)}")
-                return None
+        return self._transcribe(audio_data, sample_rate)
     
     def listen_and_transcribe(self, timeout=5, phrase_time_limit=10):
         """
@@ -112,20 +160,54 @@ class STTEngine:
         Returns:
             str: Recognized text, or None if recognition failed
         """
+        pcm = np.frombuffer(audio.get_raw_data(convert_rate=16000, convert_width=2), dtype=np.int16)
+        return self._transcribe(pcm, 16000)
+    
+    def _transcribe(self, audio_data, sample_rate):
+        """
+        Run the configured model on PCM samples.
+        
+        Shared by audio_to_text and recognize, including the result logging and
+        the mapping of recognition errors to None.
+        
+        Args:
+            audio_data (numpy.ndarray): int16 or float32 samples
+            sample_rate (int): Sample rate of the audio data (Whisper requires 16000)
+            
+        Returns:
+            str: Transcribed text, or None if transcription failed
+            
+        Raises:
+            ValueError: If Whisper is given audio at any rate other than 16 kHz.
+        """
+        if self.model_name.lower() == "whisper" and sample_rate != WHISPER_SAMPLE_RATE:
+            # faster-whisper takes raw arrays as 16 kHz; other rates would be
+            # transcribed at the wrong speed and come out as garbage
+            raise ValueError(f"Whisper requires {WHISPER_SAMPLE_RATE} Hz audio, got {sample_rate} Hz")
         try:
             if self.model_name.lower() == "whisper":
-                text = self.recognizer.recognize_whisper(
-                    audio,
-                    model="base",
-                    language="english"
-                )
+                # Whisper takes float32 in [-1, 1]; the int16 -> float32 cast and
+                # the scale are fused into one vectorized multiply
+                if audio_data.dtype == np.int16:
+                    n = audio_data.size
+                    if n <= self._buf.size:
+                        audio_f32 = self._buf[:n]
+                    else:
+                        audio_f32 = np.empty(n, dtype=np.float32)
+                    np.multiply(audio_data, INT16_SCALE, out=audio_f32, dtype=np.float32, casting='unsafe')
+                else:
+                    audio_f32 = audio_data.astype(np.float32, copy=False)
+                segments, _ = self.model.transcribe(audio_f32, language="en", beam_size=1, vad_filter=True)
+                text = "".join(segment.text for segment in segments)
             elif self.model_name.lower() == "google":
+                # Raw PCM wrapped as-is; recognize_google does its own FLAC encoding
+                audio = sr.AudioData(audio_data.tobytes(), sample_rate, audio_data.dtype.itemsize)
                 text = self.recognizer.recognize_google(audio)
             else:
                 raise ValueError(f"Unsupported STT model: {self.model_name}")
             
-            self.logger.info(f"Recognized: {text}")
-            return text.strip()
+            self.logger.info(f"STT Result: {text}")
+            return text.strip() or None
             
         except sr.UnknownValueError:
             self.logger.warning("Speech recognition could not understand audio")
@@ -0,0 +1,236 @@
+import os
+import re
+import base64
+import hashlib
+import time
+import uuid
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from gtts import gTTS, gTTSError
+
+# Sentences of a reply are synthesized in the background while the LLM is
+# still generating and streamed to the browser from /audio/<token>
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+TTS_JOB_TTL = 120  # seconds a reply's audio stays available
+TTS_WORKERS = 8
+tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS)
+
+# gTTS opens a new connection for every request it sends; its prepared
+# requests go out over this pooled session instead
+TTS_SESSION = requests.Session()
+TTS_SESSION.mount("https://", HTTPAdapter(pool_connections=TTS_WORKERS, pool_maxsize=TTS_WORKERS))
+GTTS_AUDIO_PATTERN = re.compile(rb'jQ1olc","\[\\"(.*)\\"]')
+tts_jobs = {}
+tts_jobs_lock = threading.Lock()
+
+# Reusable MP3 buffers, so each synthesized sentence does not allocate and
+# regrow a fresh one. Buffers that grew past the pooled size are not kept.
+AUDIO_BUFFER_SIZE = 256 * 1024
+audio_buffer_pool = queue.LifoQueue(maxsize=2 * TTS_WORKERS)
+
+class AudioBuffer:
+    """Write-only byte buffer that keeps its allocation between uses."""
+    def __init__(self, capacity=AUDIO_BUFFER_SIZE):
+        self.data = bytearray(capacity)
+        self.size = 0
+
+    def write(self, chunk):
+        end = self.size + len(chunk)
+        if end > len(self.data):
+            self.data.extend(bytes(max(end, 2 * len(self.data)) - len(self.data)))
+        self.data[self.size:end] = chunk
+        self.size = end
+
+    def getvalue(self):
+        return bytes(memoryview(self.data)[:self.size])
+
+def acquire_audio_buffer():
+    try:
+        return audio_buffer_pool.get_nowait()
+    except queue.Empty:
+        return AudioBuffer()
+
+def release_audio_buffer(audio_buffer):
+    if len(audio_buffer.data) > AUDIO_BUFFER_SIZE:
+        return
+    audio_buffer.size = 0
+    try:
+        audio_buffer_pool.put_nowait(audio_buffer)
+    except queue.Full:
+        pass
+
+def split_sentences(text):
+    """Split text into the sentence units that are synthesized independently."""
+    return [s.strip() for s in SENTENCE_BOUNDARY.split(text.strip()) if s.strip()]
+
+def prepare_tts_requests(sentence):
+    """
+    Return gTTS's prepared requests for a sentence, one per ~100 character part.
+
+    Returns an empty list when the sentence has nothing speakable (e.g. only
+    punctuation).
+    """
+    try:
+        return gTTS(text=sentence, lang='en')._prepare_requests()
+    except AssertionError:
+        return []
+
+# On-disk MP3 cache keyed by the exact gTTS request (text, language, speed),
+# so repeated phrases skip the round-trip to Google entirely. Files are
+# evicted least-recently-used first, by mtime.
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', 'cache/tts')
+TTS_CACHE_MAX_FILES = 5000
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+tts_cache_lock = threading.Lock()
+tts_cache_count = sum(1 for name in os.listdir(TTS_CACHE_DIR) if name.endswith('.mp3'))
+
+def tts_cache_path(prepared_request):
+    body = prepared_request.body
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return os.path.join(TTS_CACHE_DIR, f"{hashlib.blake2b(body, digest_size=16).hexdigest()}.mp3")
+
+def read_tts_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            mp3_bytes = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)  # mark as recently used
+    except OSError:
+        pass  # evicted by another writer since the read; the bytes are still good
+    return mp3_bytes
+
+def write_tts_cache(path, mp3_bytes):
+    global tts_cache_count
+    # Unique per process and thread, so gunicorn workers never share a temp file
+    fd, temp_path = tempfile.mkstemp(dir=TTS_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(mp3_bytes)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    
+    with tts_cache_lock:
+        tts_cache_count += 1
+        if tts_cache_count <= TTS_CACHE_MAX_FILES:
+            return
+        # Evict the least recently used tenth in one pass
+        entries = []
+        for entry in os.scandir(TTS_CACHE_DIR):
+            if not entry.name.endswith('.mp3'):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass  # already evicted by another worker
+        entries.sort()
+        for _, entry_path in entries[:len(entries) - int(TTS_CACHE_MAX_FILES * 0.9)]:
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                pass
+        tts_cache_count = min(len(entries), int(TTS_CACHE_MAX_FILES * 0.9))
+
+def synthesize_mp3(prepared_request):
+    """Send one prepared gTTS request and return the decoded MP3 bytes."""
+    cache_path = tts_cache_path(prepared_request)
+    mp3_bytes = read_tts_cache(cache_path)
+    if mp3_bytes is not None:
+        return mp3_bytes
+    
+    response = TTS_SESSION.send(prepared_request, timeout=30)
+    response.raise_for_status()
+    
+    audio_buffer = acquire_audio_buffer()
+    try:
+        for line in response.iter_lines(chunk_size=1024):
+            if b'jQ1olc' in line:
+                match = GTTS_AUDIO_PATTERN.search(line)
+                if not match:
+                    raise gTTSError("No audio stream in TTS API response")
+                audio_buffer.write(base64.b64decode(match.group(1)))
+        mp3_bytes = audio_buffer.getvalue()
+    finally:
+        release_audio_buffer(audio_buffer)
+    
+    if mp3_bytes:
+        write_tts_cache(cache_path, mp3_bytes)
+    return mp3_bytes
+
+class SpeechJob:
+    """Ordered background syntheses of the sentences of one reply."""
+    def __init__(self):
+        self.created = time.monotonic()
+        self.futures = []
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def add(self, sentence):
+        """Start synthesizing the next sentence of the reply."""
+        # Every part of every sentence is fetched in parallel; MP3 frames are
+        # independently decodable, so the parts are simply sent back to back
+        futures = [tts_executor.submit(synthesize_mp3, prepared_request)
+                   for prepared_request in prepare_tts_requests(sentence)]
+        with self.condition:
+            self.futures.extend(futures)
+            self.condition.notify_all()
+
+    def close(self):
+        """Mark the reply as complete; no more sentences will be added."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __iter__(self):
+        """Yield the MP3 bytes of each part in order, waiting for sentences still to come."""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.futures) and not self.closed:
+                    if not self.condition.wait(timeout=TTS_JOB_TTL):
+                        return
+                if index >= len(self.futures):
+                    return
+                future = self.futures[index]
+            index += 1
+            yield future.result()
+
+def create_speech_job():
+    """Register a SpeechJob under a new token, dropping expired ones."""
+    token = uuid.uuid4().hex
+    job = SpeechJob()
+    now = time.monotonic()
+    with tts_jobs_lock:
+        for key in [k for k, j in tts_jobs.items() if now - j.created > TTS_JOB_TTL]:
+            del tts_jobs[key]
+        tts_jobs[token] = job
+    return token, job
+
+def get_speech_job(token):
+    """Return the SpeechJob registered under token, or None if unknown or expired."""
+    with tts_jobs_lock:
+        return tts_jobs.get(token)
+
+def synthesize(text):
+    """
+    Synthesize text to MP3 bytes, fetching all of its parts in parallel.
+
+    Args:
+        text (str): Text to convert to speech.
+
+    Returns:
+        bytes: The MP3 audio; empty when the text has nothing speakable.
+    """
+    futures = [tts_executor.submit(synthesize_mp3, prepared_request)
+               for sentence in split_sentences(text)
+               for prepared_request in prepare_tts_requests(sentence)]
+    return b"".join(future.result() for future in futures)
@@ -1,33 +1,224 @@
 import os
 import io
+import hashlib
 import logging
+import queue
+import tempfile
+import threading
+from collections import OrderedDict
 import numpy as np
-from gtts import gTTS
-import edge_tts
 import asyncio
-from pydub import AudioSegment
-from pydub.playback import play
-import tempfile
-from typing import Optional, Union, BinaryIO
+import miniaudio
+import sounddevice as sd
+import soundfile as sf
+from typing import AsyncIterator, Optional, Union, BinaryIO
 import wave
 import json
+import tts
+from edge_connection import EdgeTTSConnection
+
+# Streamed playback decodes MP3 into 20 ms frames of 24 kHz mono PCM, the
+# native format of both Edge-TTS and gTTS
+STREAM_SAMPLE_RATE = 24000
+STREAM_FRAME_SAMPLES = STREAM_SAMPLE_RATE * 20 // 1000
+
+class _ChunkSource(miniaudio.StreamableSource):
+    """MP3 bytes fed from the event loop and read by the decoder thread."""
+    def __init__(self):
+        self.chunks = queue.Queue()
+        self.pending = b""
+        self.ended = False
+    
+    def feed(self, data: Optional[bytes]):
+        """Queue a chunk of MP3 data; None marks the end of the stream."""
+        self.chunks.put(data)
+    
+    def read(self, num_bytes: int) -> bytes:
+        # Blocks until data arrives, so the decoder waits on the network
+        # instead of treating a slow chunk as the end of the stream
+        while not self.pending and not self.ended:
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.ended = True
+            else:
+                self.pending = chunk
+        data, self.pending = self.pending[:num_bytes], self.pending[num_bytes:]
+        return data
 
 class TTSEngine:
     """
     Text-to-Speech engine supporting multiple backends.
     """
-    def __init__(self, engine: str = "gtts", voice: str = "en-US-AriaNeural"):
+    def __init__(self, engine: str = "gtts", voice: str = "en-US-AriaNeural",
+                 cache_dir: Optional[str] = None, memory_cache_size: int = 256,
+                 max_cache_files: int = 5000):
         """
         Initialize the TTS engine.
         
         Args:
             engine (str): TTS engine to use ('gtts' or 'edge')
             voice (str): Voice to use (only for edge-tts)
+            cache_dir (str): Directory for cached audio. Defaults to ~/.cache/echomind/tts.
+            memory_cache_size (int): Number of recent phrases also kept in memory
+            max_cache_files (int): Files kept on disk before the least recently used tenth is evicted
         """
         self.engine = engine.lower()
         self.voice = voice
         self.logger = logging.getLogger(__name__)
         
+        # Synthesized audio is cached by (engine, voice, text), so repeated
+        # phrases skip the network round-trip entirely. gTTS audio already has
+        # a bounded disk cache in tts.py, so only Edge-TTS audio is written here.
+        self.cache_dir = cache_dir or os.path.expanduser(os.path.join("~", ".cache", "echomind", "tts"))
+        self.memory_cache_size = memory_cache_size
+        self.max_cache_files = max_cache_files
+        self._memory_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._disk_cache = self.engine == "edge"
+        self._disk_cache_count = 0
+        if self._disk_cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_cache_count = sum(1 for name in os.listdir(self.cache_dir) if not name.endswith('.tmp'))
+        
+        self._edge = EdgeTTSConnection()
+        self._speech_tasks = set()  # keeps stream_speech tasks alive until done
+        
+        # Every Edge-TTS call, sync or async, runs on this one background event
+        # loop, so the connection is only ever used from the loop that owns it
+        # and survives between asyncio.run calls
+        self._loop = None
+        self._loop_thread = None
+        if self.engine == "edge":
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, name="tts-loop", daemon=True)
+            self._loop_thread.start()
+    
+    def close(self):
+        """Close the Edge-TTS connection and stop the background event loop."""
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._edge.close(), self._loop).result(timeout=5)
+        except Exception as e:
+            self.logger.warning(f"Error closing Edge-TTS connection: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+        self._loop = None
+    
+    async def _on_edge_loop(self, coro):
+        """Run a coroutine on the Edge-TTS loop and await its result from the caller's loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+    
+    async def _edge_stream(self, text: str) -> AsyncIterator[bytes]:
+        """Yield Edge-TTS audio chunks on the caller's loop as the engine's loop receives them."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        
+        async def produce():
+            try:
+                async for data in self._edge.stream(text, self.voice):
+                    loop.call_soon_threadsafe(chunks.put_nowait, data)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+        
+        producer = asyncio.run_coroutine_threadsafe(produce(), self._loop)
+        try:
+            while (data := await chunks.get()) is not None:
+                yield data
+            await asyncio.wrap_future(producer)  # re-raises any synthesis error
+        finally:
+            # Stops the synthesis if the consumer gave up early
+            producer.cancel()
+    
+    def _cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.engine}|{self.voice}|{text}".encode("utf-8")).hexdigest()
+    
+    def _remember(self, key: str, audio_data: bytes):
+        with self._cache_lock:
+            self._memory_cache[key] = audio_data
+            self._memory_cache.move_to_end(key)
+            while len(self._memory_cache) > self.memory_cache_size:
+                self._memory_cache.popitem(last=False)
+    
+    def _get_cached(self, key: str) -> Optional[bytes]:
+        """Return cached audio for the key from memory or disk, or None on a miss."""
+        with self._cache_lock:
+            audio_data = self._memory_cache.get(key)
+            if audio_data is not None:
+                self._memory_cache.move_to_end(key)
+                return audio_data
+        if not self._disk_cache:
+            return None
+        
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(path, 'rb') as f:
+                audio_data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self._remember(key, audio_data)
+        return audio_data
+    
+    def _put_cached(self, key: str, audio_data: Optional[bytes]):
+        """Store synthesized audio in memory and write it through to disk."""
+        if not audio_data:
+            return
+        self._remember(key, audio_data)
+        if not self._disk_cache:
+            return
+        path = os.path.join(self.cache_dir, key)
+        try:
+            # Unique per process and thread, unlike a thread-id suffix after fork
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(audio_data)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            self.logger.warning(f"Could not write TTS cache entry: {str(e)}")
+            return
+        
+        with self._cache_lock:
+            self._disk_cache_count += 1
+            if self._disk_cache_count > self.max_cache_files:
+                self._evict_disk_cache()
+    
+    def _evict_disk_cache(self):
+        """Delete the least recently used tenth of the disk cache, by mtime. Called with _cache_lock held."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+        keep = int(self.max_cache_files * 0.9)
+        for _, path in entries[:len(entries) - keep]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._disk_cache_count = min(len(entries), keep)
+        
+    async def warm_up(self):
+        """Open the Edge-TTS connection on the running event loop ahead of synthesis; a no-op while it is open."""
+        if self.engine != "edge":
+            return
+        try:
+            await self._on_edge_loop(self._edge.connect())
+        except Exception as e:
+            self.logger.warning(f"Edge-TTS warm-up failed: {str(e)}")
+        
     async def text_to_speech_async(self, text: str) -> Optional[bytes]:
         """
         Convert text to speech asynchronously.
@@ -36,12 +227,19 @@ class TTSEngine:
             text (str): Text to convert to speech
             
         Returns:
-            Optional[bytes]: Audio data in WAV format, or None if conversion failed
+            Optional[bytes]: Audio data in MP3 or WAV format, or None if conversion failed
         """
+        key = self._cache_key(text)
+        audio_data = self._get_cached(key)
+        if audio_data is not None:
+            return audio_data
+        
         if self.engine == "edge":
-            return await self._edge_tts_convert(text)
+            audio_data = await self._on_edge_loop(self._edge_tts_convert(text))
         else:
-            return self._gtts_convert(text)
+            audio_data = await asyncio.to_thread(self._gtts_convert, text)
+        self._put_cached(key, audio_data)
+        return audio_data
     
     def text_to_speech(self, text: str) -> Optional[bytes]:
         """
@@ -51,13 +249,21 @@ class TTSEngine:
             text (str): Text to convert to speech
             
         Returns:
-            Optional[bytes]: Audio data in WAV format, or None if conversion failed
+            Optional[bytes]: Audio data in MP3 or WAV format, or None if conversion failed
         """
         try:
+            key = self._cache_key(text)
+            audio_data = self._get_cached(key)
+            if audio_data is not None:
+                return audio_data
+            
             if self.engine == "edge":
-                return asyncio.run(self._edge_tts_convert(text))
+                future = asyncio.run_coroutine_threadsafe(self._edge_tts_convert(text), self._loop)
+                audio_data = future.result()
             else:
-                return self._gtts_convert(text)
+                audio_data = self._gtts_convert(text)
+            self._put_cached(key, audio_data)
+            return audio_data
         except Exception as e:
             self.logger.error(f"Error in text_to_speech: {str(e)}")
             return None
@@ -70,68 +276,36 @@ class TTSEngine:
             text (str): Text to convert
             
         Returns:
-            Optional[bytes]: Audio data in WAV format, or None if conversion failed
+            Optional[bytes]: Audio data in MP3 format, or None if conversion failed
         """
         try:
-            # Create a temporary file to store the MP3
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_mp3:
-                temp_mp3_path = temp_mp3.name
-            
-            # Generate speech using gTTS
-            tts = gTTS(text=text, lang='en', slow=False)
-            tts.save(temp_mp3_path)
-            
-            # Convert MP3 to WAV
-            audio = AudioSegment.from_mp3(temp_mp3_path)
-            
-            # Create a WAV file in memory
-            wav_io = io.BytesIO()
-            audio.export(wav_io, format='wav')
-            wav_data = wav_io.getvalue()
-            
-            # Clean up temporary file
-            os.unlink(temp_mp3_path)
-            
-            return wav_data
+            # The shared gTTS pipeline sends the parts in parallel over pooled
+            # connections and returns the MP3 in memory; it is decoded only
+            # when played
+            mp3_data = tts.synthesize(text)
+            return mp3_data or None
             
         except Exception as e:
             self.logger.error(f"gTTS conversion error: {str(e)}")
-            if 'temp_mp3_path' in locals() and os.path.exists(temp_mp3_path):
-                os.unlink(temp_mp3_path)
             return None
     
     async def _edge_tts_convert(self, text: str) -> Optional[bytes]:
         """
-        Convert text to speech using Edge-TTS.
+        Convert text to speech using Edge-TTS. Runs on the engine's Edge-TTS loop.
         
         Args:
             text (str): Text to convert
             
         Returns:
-            Optional[bytes]: Audio data in WAV format, or None if conversion failed
+            Optional[bytes]: Audio data in MP3 format, or None if conversion failed
         """
         try:
-            # Create a temporary file to store the WAV
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-                temp_wav_path = temp_wav.name
-            
-            # Generate speech using Edge-TTS
-            communicate = edge_tts.Communicate(text, self.voice)
-            await communicate.save(temp_wav_path)
-            
-            # Read the WAV file
-            with open(temp_wav_path, 'rb') as f:
-                wav_data = f.read()
-            
-            # Clean up temporary file
-            os.unlink(temp_wav_path)
-            
-            return wav_data
+            # Sent over the engine's persistent WebSocket instead of a new one per call
+            chunks = [data async for data in self._edge.stream(text, self.voice)]
+            return b"".join(chunks) or None
             
         except Exception as e:
             self.logger.error(f"Edge-TTS conversion error: {str(e)}")
-            if 'temp_wav_path' in locals() and os.path.exists(temp_wav_path):
-                os.unlink(temp_wav_path)
             return None
     
     def save_audio(self, audio_data: bytes, file_path: str) -> bool:
@@ -155,28 +329,186 @@ class TTSEngine:
     
     def play_audio(self, audio_data: bytes) -> bool:
         """
-        Play audio data.
+        Play audio data, returning once playback has finished.
         
         Args:
-            audio_data (bytes): Audio data in WAV format
+            audio_data (bytes): Audio data in MP3 or WAV format
             
         Returns:
             bool: True if playback was successful, False otherwise
         """
+        if not self.start_audio(audio_data):
+            return False
+        sd.wait()
+        return True
+    
+    def start_audio(self, audio_data: bytes) -> bool:
+        """
+        Start playing audio data and return without waiting for it to finish.
+        
+        Playback runs on PortAudio's audio thread; await playback_done() to
+        wait for it to end. Starting another clip cuts off the current one.
+        
+        Args:
+            audio_data (bytes): Audio data in MP3 or WAV format
+            
+        Returns:
+            bool: True if playback was started, False otherwise
+        """
         try:
-            # Create an in-memory file-like object
-            audio_io = io.BytesIO(audio_data)
+            # Decode to int16 PCM in-process rather than through an ffmpeg
+            # subprocess; MP3 starts with an ID3 tag or a frame sync
+            if audio_data[:3] == b'ID3' or audio_data[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+                decoded = miniaudio.decode(
+                    audio_data,
+                    output_format=miniaudio.SampleFormat.SIGNED16,
+                    nchannels=1,
+                    sample_rate=STREAM_SAMPLE_RATE
+                )
+                pcm = np.frombuffer(decoded.samples, dtype=np.int16)
+                sample_rate = decoded.sample_rate
+            else:
+                pcm, sample_rate = sf.read(io.BytesIO(audio_data), dtype='int16')
+            
+            # sounddevice plays from its own callback thread
+            sd.play(pcm, sample_rate)
+            return True
             
-            # Load the audio data
-            audio = AudioSegment.from_wav(audio_io)
+        except Exception as e:
+            self.logger.error(f"Error playing audio: {str(e)}")
+            return False
+    
+    async def playback_done(self):
+        """Wait, without blocking the event loop, for audio started by start_audio to finish."""
+        await asyncio.get_running_loop().run_in_executor(None, sd.wait)
+
+    def _play_stream(self, source: _ChunkSource):
+        """Decode MP3 from the source and write it to the output device as it arrives."""
+        frames = miniaudio.stream_any(
+            source,
+            source_format=miniaudio.FileFormat.MP3,
+            output_format=miniaudio.SampleFormat.SIGNED16,
+            nchannels=1,
+            sample_rate=STREAM_SAMPLE_RATE,
+            frames_to_read=STREAM_FRAME_SAMPLES
+        )
+        with sd.RawOutputStream(samplerate=STREAM_SAMPLE_RATE, channels=1, dtype='int16') as stream:
+            for frame in frames:
+                stream.write(frame)
+    
+    async def play_async(self, audio_data: bytes) -> bool:
+        """
+        Play MP3 audio data without blocking the event loop.
+        
+        Args:
+            audio_data (bytes): Audio data in MP3 format
             
-            # Play the audio
-            play(audio)
+        Returns:
+            bool: True if playback was successful, False otherwise
+        """
+        source = _ChunkSource()
+        source.feed(audio_data)
+        source.feed(None)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._play_stream, source)
             return True
+        except Exception as e:
+            self.logger.error(f"Error playing audio: {str(e)}")
+            return False
+    
+    def open_player(self):
+        """
+        Start a playback stream that MP3 audio can be fed into while it plays.
+        
+        Feeding several clips back to back plays them through one output
+        stream, without reopening the device between them.
+        
+        Returns:
+            tuple: The _ChunkSource to feed (feeding None ends playback) and a
+            future that completes once everything fed has been played.
+        """
+        source = _ChunkSource()
+        playback = asyncio.get_running_loop().run_in_executor(None, self._play_stream, source)
+        return source, playback
+    
+    def stream_speech(self, text: str) -> asyncio.Queue:
+        """
+        Start synthesizing text in the background.
+        
+        Args:
+            text (str): Text to convert to speech
             
+        Returns:
+            asyncio.Queue: Receives the MP3 audio in chunks as it becomes
+            available, followed by None, also after a failure.
+        """
+        chunks = asyncio.Queue()
+        
+        async def produce():
+            try:
+                await self._synthesize_into(text, chunks.put_nowait)
+            finally:
+                chunks.put_nowait(None)
+        
+        task = asyncio.create_task(produce())
+        self._speech_tasks.add(task)
+        task.add_done_callback(self._speech_tasks.discard)
+        return chunks
+    
+    async def _synthesize_into(self, text: str, feed) -> bool:
+        """
+        Synthesize text and pass its MP3 audio to feed as it becomes available.
+        
+        Edge-TTS audio is passed on while it is still being received; gTTS audio
+        and cached phrases are passed whole.
+        
+        Returns:
+            bool: True if audio was produced, False otherwise
+        """
+        key = self._cache_key(text)
+        audio_data = self._get_cached(key)
+        try:
+            if audio_data is None and self.engine == "edge":
+                chunks = []
+                async for data in self._edge_stream(text):
+                    feed(data)
+                    chunks.append(data)
+                self._put_cached(key, b"".join(chunks))
+                return bool(chunks)
+            if audio_data is None:
+                audio_data = await self.text_to_speech_async(text)
+            if audio_data:
+                feed(audio_data)
+            return bool(audio_data)
+        except Exception as e:
+            self.logger.error(f"Edge-TTS streaming error: {str(e)}")
+            return False
+    
+    async def speak_stream(self, text: str) -> bool:
+        """
+        Speak text, starting playback as soon as the first audio arrives.
+        
+        Edge-TTS audio is played while it is still being received; gTTS audio
+        and cached phrases are fetched whole and then streamed to the device.
+        
+        Args:
+            text (str): Text to speak
+            
+        Returns:
+            bool: True if playback was successful, False otherwise
+        """
+        source, playback = self.open_player()
+        try:
+            success = await self._synthesize_into(text, source.feed)
+        finally:
+            source.feed(None)
+        
+        try:
+            await playback
         except Exception as e:
             self.logger.error(f"Error playing audio: {str(e)}")
             return False
+        return success
 
 # Example usage
 if __name__ == "__main__":
@@ -188,8 +520,8 @@ if __name__ == "__main__":
     tts_gtts = TTSEngine(engine="gtts")
     audio_data = tts_gtts.text_to_speech("Hello, this is a test using gTTS.")
     if audio_data:
-        tts_gtts.save_audio(audio_data, "output_gtts.wav")
-        print("Saved to output_gtts.wav")
+        tts_gtts.save_audio(audio_data, "output_gtts.mp3")
+        print("Saved to output_gtts.mp3")
     
     # Example 2: Using Edge-TTS
     print("\nTesting Edge-TTS...")
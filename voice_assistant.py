@@ -2,7 +2,9 @@ import os
 import logging
 import json
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
+import tiktoken
 from dotenv import load_dotenv
 
 # Import our modules
@@ -10,6 +12,7 @@ from audio_capture import AudioCapture
 from stt_engine import STTEngine
 from ai_processor import AIProcessor
 from tts_engine import TTSEngine
+import tts
 
 # Configure logging
 logging.basicConfig(
@@ -22,23 +25,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Token budget for the conversation history sent with each request
+MAX_HISTORY_TOKENS = 2000
+
 class VoiceAssistant:
     def __init__(self):
         """Initialize the voice assistant with all required components."""
         # Load environment variables
         load_dotenv()
         
-        # Initialize components
-        self.audio_capture = AudioCapture(sample_rate=16000, chunk_size=1024)
-        self.stt_engine = STTEngine(model_name="whisper")
-        self.ai_processor = AIProcessor(
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            model="openai/gpt-3.5-turbo"
-        )
-        self.tts_engine = TTSEngine(engine="edge", voice="en-US-AriaNeural")
+        # Initialize components. Loading the Whisper model dominates start-up,
+        # so it runs in the background while everything else is set up.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stt_future = executor.submit(STTEngine, model_name="whisper")
+            self.audio_capture = AudioCapture(sample_rate=16000, chunk_size=1024)
+            self.ai_processor = AIProcessor(
+                api_key=os.getenv("OPENROUTER_API_KEY"),
+                model="openai/gpt-3.5-turbo"
+            )
+            self.tts_engine = TTSEngine(engine="edge", voice="en-US-AriaNeural")
+            self.stt_engine = stt_future.result()
         
         # Conversation history
         self.conversation_history: List[Dict[str, str]] = []
+        # Token count of each history message, so trimming never re-encodes
+        self.history_tokens: List[int] = []
+        self.tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")
         
         # System prompt
         self.system_prompt = """
@@ -46,41 +58,126 @@ class VoiceAssistant:
         Keep your responses concise and natural-sounding for voice interaction.
         """
     
-    async def process_voice_input(self) -> Optional[str]:
-        """Process voice input from the user."""
-        try:
-            # Start audio capture
-            with self.audio_capture as ac:
-                print("Listening... (press Ctrl+C to stop)")
-                audio_data = ac.record_until_silence()
+    async def capture_task(self, q_audio: asyncio.Queue):
+        """
+        Record utterances and queue them for STT.
+        
+        While a reply plays the capture is muted (see playback_task), so the
+        assistant does not transcribe its own voice.
+        """
+        with self.audio_capture as ac:
+            print("Listening... (press Ctrl+C to stop)")
+            while True:
+                audio_data = await asyncio.to_thread(ac.record_until_silence)
+                if audio_data.size == 0:
+                    logger.warning("No audio data captured")
+                    continue
+                await q_audio.put(audio_data)
+    
+    async def stt_task(self, q_audio: asyncio.Queue, q_text: asyncio.Queue):
+        """Transcribe queued utterances while the next one is being recorded."""
+        while True:
+            audio_data = await q_audio.get()
+            try:
+                text = await asyncio.to_thread(self.stt_engine.audio_to_text, audio_data)
+            except Exception as e:
+                logger.error(f"Error processing voice input: {str(e)}")
+                text = None
             
-            if audio_data.size == 0:
-                logger.warning("No audio data captured")
-                return None
-                
-            # Convert speech to text
-            text = self.stt_engine.audio_to_text(audio_data)
             if not text:
                 logger.warning("Could not transcribe audio")
-                return None
-                
+                print("I didn't catch that. Could you please repeat?")
+                continue
+            
             logger.info(f"You said: {text}")
-            return text
+            await q_text.put(text)
+    
+    async def llm_tts_task(self, q_text: asyncio.Queue, q_reply: asyncio.Queue):
+        """Generate a reply for each transcribed turn, in order."""
+        while True:
+            user_input = await q_text.get()
+            await self.generate_response(user_input, q_reply)
+            # Marks the end of the reply for playback
+            await q_reply.put(None)
+    
+    async def playback_task(self, q_reply: asyncio.Queue):
+        """
+        Play reply sentences in order, closing the microphone while a reply plays.
+        
+        All sentences of a reply are fed into one output stream, and Edge-TTS
+        audio starts playing while it is still being received.
+        """
+        source = playback = None
+        while True:
+            speech = await q_reply.get()
+            if speech is None:
+                if playback is not None:
+                    source.feed(None)
+                    try:
+                        await playback
+                    except Exception as e:
+                        logger.error(f"Error playing audio: {str(e)}")
+                    source = playback = None
+                # Discard whatever the microphone picked up during playback
+                self.audio_capture.unmute()
+                continue
             
-        except Exception as e:
-            logger.error(f"Error processing voice input: {str(e)}")
-            return None
+            if playback is None:
+                # Also aborts a recording that is already waiting for speech
+                self.audio_capture.mute()
+                source, playback = self.tts_engine.open_player()
+            while (data := await speech.get()) is not None:
+                source.feed(data)
     
-    async def generate_response(self, user_input: str) -> Optional[bytes]:
-        """Generate a voice response to the user's input."""
+    async def _stream_reply(self, user_input: str):
+        """Yield the reply's content deltas, read from the blocking HTTP stream in a worker thread."""
+        loop = asyncio.get_running_loop()
+        deltas = asyncio.Queue()
+        
+        def produce():
+            try:
+                for delta in self.ai_processor.stream_conversation(
+                    user_input=user_input,
+                    conversation_history=self.conversation_history,
+                    system_prompt=self.system_prompt
+                ):
+                    loop.call_soon_threadsafe(deltas.put_nowait, delta)
+            finally:
+                loop.call_soon_threadsafe(deltas.put_nowait, None)
+        
+        producer = loop.run_in_executor(None, produce)
+        while (delta := await deltas.get()) is not None:
+            yield delta
+        await producer  # re-raises any error from the stream
+    
+    async def generate_response(self, user_input: str, q_reply: asyncio.Queue) -> Optional[str]:
+        """
+        Stream a response to the user's input into speech and record the turn.
+        
+        Each sentence is handed to TTS as soon as it is complete, and the
+        queue its audio arrives on is queued for playback in order.
+        """
+        # Re-open the TTS connection, if it dropped or aged out while idle,
+        # while the LLM is still working on the first sentence
+        prewarm = asyncio.create_task(self.tts_engine.warm_up())
+        parts = []
+        pending = ""
+        
+        async def speak(sentence):
+            sentence = sentence.strip()
+            if sentence:
+                await q_reply.put(self.tts_engine.stream_speech(sentence))
+        
         try:
-            # Get AI response
-            ai_response = self.ai_processor.process_conversation(
-                user_input=user_input,
-                conversation_history=self.conversation_history,
-                system_prompt=self.system_prompt
-            )
+            async for delta in self._stream_reply(user_input):
+                parts.append(delta)
+                pending += delta
+                *sentences, pending = tts.SENTENCE_BOUNDARY.split(pending)
+                for sentence in sentences:
+                    await speak(sentence)
+            await speak(pending)
             
+            ai_response = "".join(parts).strip()
             if not ai_response:
                 logger.error("Failed to get AI response")
                 return None
@@ -88,20 +185,40 @@ class VoiceAssistant:
             logger.info(f"AI: {ai_response}")
             
             # Update conversation history
-            self.conversation_history.append({"role": "user", "content": user_input})
-            self.conversation_history.append({"role": "assistant", "content": ai_response})
+            self._append_history({"role": "user", "content": user_input},
+                                 {"role": "assistant", "content": ai_response})
             
-            # Limit conversation history to last 10 exchanges (20 messages)
-            if len(self.conversation_history) > 20:
-                self.conversation_history = self.conversation_history[-20:]
-            
-            # Convert text to speech
-            audio_data = await self.tts_engine.text_to_speech_async(ai_response)
-            return audio_data
+            return ai_response
             
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             return None
+        finally:
+            await prewarm
+    
+    def _append_history(self, *messages: Dict[str, str]):
+        """
+        Append messages and keep the history within MAX_HISTORY_TOKENS.
+        
+        Once over budget, the oldest exchanges are dropped in one block down to
+        half the budget rather than one per turn, so the prompt prefix stays
+        identical between trims and provider-side prompt caching keeps hitting.
+        """
+        for message in messages:
+            self.conversation_history.append(message)
+            self.history_tokens.append(len(self.tokenizer.encode(message["content"])))
+        
+        total = sum(self.history_tokens)
+        if total <= MAX_HISTORY_TOKENS:
+            return
+        drop = 0
+        # The newest exchange is always kept, even if it alone exceeds half the budget
+        while drop < len(self.history_tokens) - 2 and total > MAX_HISTORY_TOKENS // 2:
+            # Whole user/assistant pairs only
+            total -= sum(self.history_tokens[drop:drop + 2])
+            drop += 2
+        del self.conversation_history[:drop]
+        del self.history_tokens[:drop]
     
     async def run_conversation_loop(self):
         """Run the main conversation loop."""
@@ -110,21 +227,20 @@ class VoiceAssistant:
         print("Press Ctrl+C to exit")
         print("="*50 + "\n")
         
+        # Capture, STT, LLM and playback run concurrently as a pipeline; the
+        # small queues apply backpressure between stages
+        q_audio = asyncio.Queue(maxsize=2)
+        q_text = asyncio.Queue(maxsize=2)
+        q_reply = asyncio.Queue(maxsize=2)
         try:
-            while True:
-                # Get voice input
-                user_input = await self.process_voice_input()
-                if not user_input:
-                    print("I didn't catch that. Could you please repeat?")
-                    continue
-                
-                # Generate and speak response
-                audio_data = await self.generate_response(user_input)
-                if audio_data:
-                    self.tts_engine.play_audio(audio_data)
-                
-        except KeyboardInterrupt:
-            print("\nGoodbye!")
+            # Open the Edge-TTS socket before the first reply
+            await self.tts_engine.warm_up()
+            await asyncio.gather(
+                self.capture_task(q_audio),
+                self.stt_task(q_audio, q_text),
+                self.llm_tts_task(q_text, q_reply),
+                self.playback_task(q_reply)
+            )
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             print(f"An error occurred: {str(e)}")
@@ -139,7 +255,12 @@ def main():
     
     # Create and run the assistant
     assistant = VoiceAssistant()
-    asyncio.run(assistant.run_conversation_loop())
+    try:
+        asyncio.run(assistant.run_conversation_loop())
+    except KeyboardInterrupt:
+        print("\nGoodbye!")
+    finally:
+        assistant.tts_engine.close()
 
 if __name__ == "__main__":
     main()